@@ -1,16 +1,19 @@
 import os
+import io
+import math
 import faiss
-import pickle
 import numpy as np
 import pytesseract
 from flask import Flask, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from werkzeug.utils import secure_filename
 import ollama
-import tempfile
-import shutil
 import traceback
 import logging
 import time
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -27,9 +30,15 @@ except ImportError:
     PdfReader = None
     logger.warning("PyPDF2 not available")
 
+try:
+    import pypdfium2 as pdfium
+    logger.info("pypdfium2 imported successfully")
+except ImportError:
+    pdfium = None
+    logger.warning("pypdfium2 not available - using PyPDF2 for PDFs")
+
 try:
     from PIL import Image
-    import pytesseract
     logger.info("PIL and pytesseract imported successfully")
 except ImportError:
     Image = None
@@ -43,83 +52,244 @@ except ImportError:
     docx = None
     logger.warning("python-docx not available")
 
+try:
+    import orjson
+    logger.info("orjson imported successfully")
+except ImportError:
+    orjson = None
+    logger.warning("orjson not available - using Flask's default JSON encoder")
+
+if orjson:
+    class OrjsonProvider(DefaultJSONProvider):
+        """Flask JSON provider backed by orjson's C encoder"""
+        def dumps(self, obj, **kwargs):
+            return orjson.dumps(obj, default=self.default, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+        
+        def loads(self, s, **kwargs):
+            return orjson.loads(s)
+
 # Flask app setup
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+if orjson:
+    app.json = OrjsonProvider(app)
 
 # ------------------ Config ------------------
-UPLOAD_FOLDER = 'uploads'
 INDEX_FILE = "faiss_index"
-DOCS_FILE = "docs.pkl"
+DOCS_FILE = "docs.bin"  # Chunk texts as one concatenated UTF-8 buffer
+DOCS_OFFSETS_FILE = "docs_offsets.npy"  # Chunk i spans [offsets[i], offsets[i+1]) in DOCS_FILE
 CHUNK_SIZE = 500
 CHUNK_OVERLAP = 50
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'docx'}
+OCR_CONFIG = "--oem 1 --psm 6"  # LSTM engine only, single uniform block of text
+
+# FAISS index settings
+IVF_MIN_VECTORS = 1000  # Below this, a brute-force (non-IVF) index is used
+IVFPQ_MIN_VECTORS = 100000  # Above this, vectors are also product-quantized
+IVF_NPROBE = 8  # Inverted lists scanned per query
+PQ_M = 16  # PQ sub-quantizers (must divide the embedding dimension)
+GPU_MIN_VECTORS = 50000  # Serve queries from GPU (faiss-gpu + CUDA) only above this size
+SQ_TYPE = faiss.ScalarQuantizer.QT_8bit  # Storage format for non-PQ indexes (QT_fp16 for higher fidelity)
+# Memory-map the index on POSIX only: Windows refuses to replace or delete a mapped file on upload / clear
+INDEX_IO_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if os.name != "nt" else 0
 
 # Ollama settings
 EMBEDDING_MODEL = "nomic-embed-text"  # Try: all-minilm, mxbai-embed-large
 CHAT_MODEL = "llama3.2"  # Try: llama3.2, phi3, qwen2
+EMBED_BATCH_SIZE = 32  # Chunks per /api/embed request
+EMBED_WORKERS = 8  # Concurrent /api/embed requests during upload
 MAX_RETRIES = 3
 RETRY_DELAY = 2  # seconds
+OLLAMA_STATUS_TTL = 30  # seconds a /status Ollama check stays fresh
+
+# FAISS GPU resources, created on first use when faiss-gpu and a CUDA device are present
+gpu_resources = None
 
-# Create upload directory
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Last Ollama connection test, reused by /status until it is OLLAMA_STATUS_TTL old
+ollama_status_cache = {"checked_at": None, "ok": False, "message": ""}
+
+# In-process copy of the FAISS index and chunks, reloaded when any of their files changes
+index_lock = threading.Lock()
+index_cache = {"mtime": None, "index": None, "docs": None}
 
 # ------------------ Helpers ------------------
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def chunk_text(text, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
-    """Split text into overlapping chunks."""
-    chunks = []
+def chunk_text_stream(pieces, chunk_size=CHUNK_SIZE, overlap=CHUNK_OVERLAP):
+    """Split a stream of text pieces into overlapping chunks.
+    
+    Chunks are emitted as soon as the window fills. Within a piece, chunks are
+    sliced at a moving offset and the buffer is trimmed once per piece, so a
+    single large piece (a whole .txt/.docx) is not re-copied for every chunk.
+    """
+    step = chunk_size - overlap
+    buffer = ""
+    for piece in pieces:
+        buffer += piece
+        start = 0
+        while len(buffer) - start >= chunk_size:
+            yield buffer[start:start + chunk_size]
+            start += step
+        buffer = buffer[start:]
     start = 0
-    while start < len(text):
-        end = min(len(text), start + chunk_size)
-        chunks.append(text[start:end])
-        start += chunk_size - overlap
-    return chunks
-
-def extract_text_from_file(file_path):
-    ext = os.path.splitext(file_path)[1].lower()
-    logger.info(f"Extracting text from {ext} file: {file_path}")
+    while start < len(buffer):
+        yield buffer[start:start + chunk_size]
+        start += step
+
+def extract_text_stream(data, ext):
+    """Yield the text of an uploaded file page by page, without touching disk"""
+    logger.info(f"Extracting text from {ext} upload ({len(data)} bytes)")
     
     if ext == ".pdf":
+        if pdfium:
+            # PDFium (C++) is much faster than PyPDF2's pure-Python parser
+            pdf = pdfium.PdfDocument(data)
+            try:
+                for page in pdf:
+                    textpage = page.get_textpage()
+                    t = textpage.get_text_range()
+                    textpage.close()
+                    page.close()
+                    if t:
+                        yield t + "\n"
+            finally:
+                pdf.close()
+            return
         if not PdfReader:
-            raise ImportError("PyPDF2 is required for PDF files")
-        reader = PdfReader(file_path)
-        text = ""
+            raise ImportError("pypdfium2 or PyPDF2 is required for PDF files")
+        reader = PdfReader(io.BytesIO(data))
         for page in reader.pages:
             t = page.extract_text()
             if t:
-                text += t + "\n"
-        return text
+                yield t + "\n"
     
     elif ext in [".jpg", ".jpeg", ".png"]:
         if not Image or not pytesseract:
             raise ImportError("Pillow and pytesseract are required for image files")
-        img = Image.open(file_path)
-        text = pytesseract.image_to_string(img)
-        return text
+        img = Image.open(io.BytesIO(data)).convert("L")
+        yield pytesseract.image_to_string(img, config=OCR_CONFIG)
     
     elif ext == ".txt":
-        with open(file_path, "r", encoding="utf-8") as f:
-            return f.read()
+        yield data.decode("utf-8")
     
     elif ext == ".docx":
         if not docx:
             raise ImportError("python-docx is required for DOCX files")
-        doc = docx.Document(file_path)
-        return "\n".join([p.text for p in doc.paragraphs])
+        doc = docx.Document(io.BytesIO(data))
+        yield "\n".join([p.text for p in doc.paragraphs])
     
     else:
         raise ValueError(f"Unsupported file type: {ext}")
 
-def ollama_embeddings_with_retry(text, max_retries=MAX_RETRIES):
-    """Get embeddings with retry logic"""
+def build_faiss_index(vectors):
+    """Pick a FAISS index for the corpus size, then train and fill it.
+    
+    Vectors are L2-normalized in place and searched by inner product (cosine).
+    """
+    faiss.normalize_L2(vectors)
+    n, dimension = vectors.shape
+    if n < IVF_MIN_VECTORS:
+        index = faiss.IndexScalarQuantizer(dimension, SQ_TYPE, faiss.METRIC_INNER_PRODUCT)
+    else:
+        nlist = max(1, int(4 * math.sqrt(n)))
+        quantizer = faiss.IndexFlatIP(dimension)
+        if n >= IVFPQ_MIN_VECTORS and dimension % PQ_M == 0:
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, PQ_M, 8, faiss.METRIC_INNER_PRODUCT)
+        else:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dimension, nlist, SQ_TYPE, faiss.METRIC_INNER_PRODUCT)
+    index.train(vectors)
+    index.add(vectors)
+    return index
+
+class ChunkStore:
+    """Read-only view of the stored chunk texts.
+    
+    Only the chunks actually indexed are read and decoded, instead of unpickling the whole
+    corpus. No file is kept open or mapped between reads, so uploads and /clear can replace
+    or delete the files even on Windows.
+    """
+    def __init__(self, data_path=DOCS_FILE, offsets_path=DOCS_OFFSETS_FILE):
+        self.data_path = data_path
+        self.offsets = np.load(offsets_path)  # 8 bytes per chunk, small enough to hold in memory
+    
+    def __len__(self):
+        return len(self.offsets) - 1
+    
+    def __getitem__(self, i):
+        start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+        with open(self.data_path, "rb") as f:
+            f.seek(start)
+            return f.read(end - start).decode("utf-8")
+
+def save_chunks(chunks, data_path=DOCS_FILE, offsets_path=DOCS_OFFSETS_FILE):
+    """Write chunk texts in the ChunkStore layout"""
+    encoded = [chunk.encode("utf-8") for chunk in chunks]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    
+    # Write aside and rename, so a reader never sees a half-written file
+    with open(data_path + ".tmp", "wb") as f:
+        f.write(b"".join(encoded))
+    with open(offsets_path + ".tmp", "wb") as f:
+        np.save(f, offsets)
+    os.replace(data_path + ".tmp", data_path)
+    os.replace(offsets_path + ".tmp", offsets_path)
+
+def maybe_to_gpu(index):
+    """Clone a large index onto the GPU for searching; the CPU copy stays the one on disk"""
+    global gpu_resources
+    if index.ntotal < GPU_MIN_VECTORS or not hasattr(faiss, "StandardGpuResources"):
+        return index
+    if faiss.get_num_gpus() == 0:
+        return index
+    try:
+        if gpu_resources is None:
+            gpu_resources = faiss.StandardGpuResources()
+        gpu_index = faiss.index_cpu_to_gpu(gpu_resources, 0, index)
+        logger.info(f"Serving FAISS index with {index.ntotal} vectors from GPU")
+        return gpu_index
+    except Exception as e:
+        logger.warning(f"Could not move FAISS index to GPU, searching on CPU: {str(e)}")
+        return index
+
+def load_index():
+    """Return (index, docs), reading them from disk only when one of their files changed.
+    
+    Returns (None, None) while an upload is part-way through replacing the files,
+    i.e. when the index and chunk store on disk don't line up.
+    """
+    # Key on all three files: another worker's upload replaces them one at a time, and an
+    # index-only key could pin a new index to old chunks for good
+    mtime = tuple(os.path.getmtime(path) for path in (INDEX_FILE, DOCS_FILE, DOCS_OFFSETS_FILE))
+    with index_lock:
+        if index_cache["index"] is None or index_cache["mtime"] != mtime:
+            logger.info("Loading FAISS index and documents from disk")
+            # Memory-mapped where possible: pages are faulted in on demand and shared between workers
+            index = faiss.read_index(INDEX_FILE, INDEX_IO_FLAGS)
+            if isinstance(index, faiss.IndexIVF):
+                index.nprobe = IVF_NPROBE
+            docs = ChunkStore()
+            if index.ntotal != len(docs):
+                # Mid-upload (another thread/worker): never cache or serve this pairing
+                logger.warning(f"Index has {index.ntotal} vectors but store has {len(docs)} chunks, upload in progress")
+                return None, None
+            index = maybe_to_gpu(index)
+            index_cache.update(mtime=mtime, index=index, docs=docs)
+        return index_cache["index"], index_cache["docs"]
+
+def invalidate_index_cache():
+    """Drop the in-process index so the next query reloads it"""
+    with index_lock:
+        index_cache.update(mtime=None, index=None, docs=None)
+
+def ollama_embed_batch_with_retry(texts, max_retries=MAX_RETRIES):
+    """Get embeddings for a list of texts in one request, with retry logic"""
     for attempt in range(max_retries):
         try:
-            logger.debug(f"Embedding attempt {attempt + 1}/{max_retries}")
-            response = ollama.embeddings(model=EMBEDDING_MODEL, prompt=text)
-            return response["embedding"]
+            logger.debug(f"Embedding attempt {attempt + 1}/{max_retries} ({len(texts)} texts)")
+            response = ollama.embed(model=EMBEDDING_MODEL, input=texts)
+            return response["embeddings"]
         except Exception as e:
             logger.warning(f"Embedding attempt {attempt + 1} failed: {str(e)}")
             if attempt < max_retries - 1:
@@ -143,11 +313,23 @@ def ollama_chat_with_retry(messages, max_retries=MAX_RETRIES):
             else:
                 raise e
 
+@functools.lru_cache(maxsize=1024)
+def embed_question(question):
+    """L2-normalized float32 question embedding as bytes, memoized on the question text"""
+    q_emb = np.array([ollama_embed_batch_with_retry([question])[0]], dtype=np.float32)
+    faiss.normalize_L2(q_emb)
+    return q_emb.tobytes()
+
+@functools.lru_cache(maxsize=1024)
+def cached_chat_answer(prompt):
+    """Single-prompt chat completion, memoized on the prompt text"""
+    return ollama_chat_with_retry([{"role": "user", "content": prompt}])
+
 def test_ollama_connection():
     """Test if Ollama is working properly"""
     try:
         logger.info("Testing embedding model...")
-        emb = ollama_embeddings_with_retry("test")
+        emb = ollama_embed_batch_with_retry(["test"])[0]
         logger.info(f"✅ Embedding model working - dimension: {len(emb)}")
         
         logger.info("Testing chat model...")
@@ -159,11 +341,30 @@ def test_ollama_connection():
         logger.error(f"❌ Ollama test failed: {str(e)}")
         return False, str(e)
 
+def cached_ollama_status():
+    """Return test_ollama_connection()'s result, re-running it at most every OLLAMA_STATUS_TTL seconds"""
+    now = time.monotonic()
+    checked_at = ollama_status_cache["checked_at"]
+    if checked_at is None or now - checked_at > OLLAMA_STATUS_TTL:
+        ok, message = test_ollama_connection()
+        ollama_status_cache.update(checked_at=now, ok=ok, message=message)
+    return ollama_status_cache["ok"], ollama_status_cache["message"]
+
 # ------------------ API Routes ------------------
 
 @app.route('/health', methods=['GET'])
 def health_check():
-    """Health check endpoint"""
+    """Liveness check; does not touch Ollama"""
+    return jsonify({
+        "status": "healthy",
+        "message": "Flask RAG API is running",
+        "embedding_model": EMBEDDING_MODEL,
+        "chat_model": CHAT_MODEL
+    })
+
+@app.route('/health/deep', methods=['GET'])
+def deep_health_check():
+    """Health check that runs a live embedding + chat call against Ollama"""
     ollama_status, ollama_msg = test_ollama_connection()
     return jsonify({
         "status": "healthy" if ollama_status else "degraded",
@@ -193,74 +394,75 @@ def upload_file():
             logger.error(f"File type not allowed: {file.filename}")
             return jsonify({"error": f"File type not allowed. Supported: {', '.join(ALLOWED_EXTENSIONS)}"}), 400
         
-        # Save uploaded file
+        # Read the upload in memory; nothing is written to disk
         filename = secure_filename(file.filename)
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(file_path)
-        logger.info(f"File saved to: {file_path}")
+        ext = "." + file.filename.rsplit('.', 1)[1].lower()
+        data = file.read()
+        logger.info(f"Received {filename} ({len(data)} bytes)")
         
-        # Extract text from file
+        # Extract text and split it into chunks page by page
         try:
-            text = extract_text_from_file(file_path)
-            logger.info(f"Extracted text length: {len(text)} characters")
+            chunks = list(chunk_text_stream(extract_text_stream(data, ext)))
+            logger.info(f"Created {len(chunks)} chunks")
         except Exception as e:
             logger.error(f"Error extracting text: {str(e)}")
-            os.remove(file_path)
             return jsonify({"error": f"Error extracting text: {str(e)}"}), 400
         
-        if not text.strip():
+        if not any(chunk.strip() for chunk in chunks):
             logger.error("No text found in file")
-            os.remove(file_path)
             return jsonify({"error": "No text found in the file"}), 400
         
-        # Split into chunks
-        chunks = chunk_text(text)
-        logger.info(f"Created {len(chunks)} chunks")
-        
-        # Create embeddings with retry logic
-        vectors = []
-        failed_chunks = []
-        
-        for i, chunk in enumerate(chunks):
-            try:
-                logger.debug(f"Creating embedding for chunk {i+1}/{len(chunks)}")
-                emb = ollama_embeddings_with_retry(chunk)
-                vectors.append(emb)
-            except Exception as e:
-                logger.error(f"Failed to create embedding for chunk {i}: {str(e)}")
-                failed_chunks.append(i)
-                # Continue with other chunks instead of failing completely
-                continue
-        
-        if not vectors:
+        # Create embeddings in concurrent batches with retry logic
+        batch_starts = range(0, len(chunks), EMBED_BATCH_SIZE)
+        vectors = None  # (len(chunks), d) float32, allocated once the dimension is known
+        ok = np.zeros(len(chunks), dtype=bool)
+        
+        with ThreadPoolExecutor(max_workers=EMBED_WORKERS) as executor:
+            futures = {
+                executor.submit(ollama_embed_batch_with_retry, chunks[start:start + EMBED_BATCH_SIZE]): start
+                for start in batch_starts
+            }
+            for future in as_completed(futures):
+                start = futures[future]
+                end = min(start + EMBED_BATCH_SIZE, len(chunks))
+                try:
+                    batch = future.result()
+                    if vectors is None:
+                        vectors = np.empty((len(chunks), len(batch[0])), dtype=np.float32)
+                    vectors[start:end] = batch
+                    ok[start:end] = True
+                    logger.debug(f"Created embeddings for chunks {start+1}-{end}/{len(chunks)}")
+                except Exception as e:
+                    # Keep the other batches instead of failing completely
+                    logger.error(f"Failed to create embeddings for chunks {start}-{end-1}: {str(e)}")
+        
+        if vectors is None:
             logger.error("No embeddings could be created")
-            os.remove(file_path)
             return jsonify({"error": "Failed to create any embeddings. Check Ollama status."}), 500
         
+        failed_chunks = np.flatnonzero(~ok).tolist()
         if failed_chunks:
             logger.warning(f"Failed to process {len(failed_chunks)} chunks: {failed_chunks}")
-        
-        vectors = np.array(vectors).astype("float32")
+            vectors = vectors[ok]
         logger.info(f"Created embeddings matrix: {vectors.shape}")
         
         # Initialize FAISS index
-        dimension = vectors.shape[1]
-        index = faiss.IndexFlatL2(dimension)
-        index.add(vectors)
-        logger.info(f"Created FAISS index with {index.ntotal} vectors")
+        index = build_faiss_index(vectors)
+        logger.info(f"Created {type(index).__name__} with {index.ntotal} vectors")
         
         # Only keep chunks that have embeddings
-        successful_chunks = [chunk for i, chunk in enumerate(chunks) if i not in failed_chunks]
-        
-        # Save FAISS index + chunks
-        faiss.write_index(index, INDEX_FILE)
-        with open(DOCS_FILE, "wb") as f:
-            pickle.dump(successful_chunks, f)
+        successful_chunks = [chunk for chunk, keep in zip(chunks, ok) if keep]
+        
+        # Save chunks + FAISS index
+        # Write to a new file and rename it into place: truncating the existing file
+        # would pull the pages out from under a memory-mapped copy still serving queries.
+        # The files are replaced one at a time; load_index refuses a pair that does not line up
+        save_chunks(successful_chunks)
+        faiss.write_index(index, INDEX_FILE + ".tmp")
+        os.replace(INDEX_FILE + ".tmp", INDEX_FILE)
+        invalidate_index_cache()
         logger.info("Saved index and chunks to disk")
         
-        # Clean up uploaded file
-        os.remove(file_path)
-        
         return jsonify({
             "success": True,
             "message": f"Successfully processed {len(successful_chunks)} chunks from {filename}",
@@ -281,7 +483,7 @@ def query_documents():
         logger.info("Query request received")
         
         # Check if index exists
-        if not os.path.exists(INDEX_FILE) or not os.path.exists(DOCS_FILE):
+        if not all(os.path.exists(f) for f in (INDEX_FILE, DOCS_FILE, DOCS_OFFSETS_FILE)):
             logger.error("Index files don't exist")
             return jsonify({"error": "No documents indexed. Please upload a file first."}), 400
         
@@ -300,19 +502,17 @@ def query_documents():
         
         logger.info(f"Processing question: {question}")
         
-        # Load FAISS index and documents
-        logger.info("Loading FAISS index and documents")
-        index = faiss.read_index(INDEX_FILE)
-        with open(DOCS_FILE, "rb") as f:
-            docs = pickle.load(f)
+        # Load FAISS index and documents (cached in-process)
+        index, docs = load_index()
+        if index is None:
+            return jsonify({"error": "Documents are being re-indexed. Please retry in a moment."}), 400
         
-        logger.info(f"Loaded index with {index.ntotal} vectors and {len(docs)} document chunks")
+        logger.info(f"Using index with {index.ntotal} vectors and {len(docs)} document chunks")
         
         # Embed the question with retry logic
         try:
             logger.info("Creating question embedding")
-            q_emb = ollama_embeddings_with_retry(question)
-            q_emb = np.array([q_emb]).astype("float32")
+            q_emb = np.frombuffer(embed_question(question), dtype=np.float32).reshape(1, -1)
             logger.info(f"Question embedding shape: {q_emb.shape}")
         except Exception as e:
             logger.error(f"Error creating question embedding: {str(e)}")
@@ -325,8 +525,11 @@ def query_documents():
         k = min(3, len(docs))  # Get top 3 or less if fewer docs
         logger.info(f"Searching for top {k} similar chunks")
         D, I = index.search(q_emb, k=k)
-        retrieved = [docs[i] for i in I[0]]
-        logger.info(f"Retrieved {len(retrieved)} chunks with distances: {D[0].tolist()}")
+        # IVF search pads with -1 when the probed lists hold fewer than k vectors
+        found = I[0] >= 0
+        retrieved = [docs[i] for i in I[0][found]]
+        scores = D[0][found].tolist()
+        logger.info(f"Retrieved {len(retrieved)} chunks with cosine similarities: {scores}")
         
         # Get answer from Ollama with retry logic
         context = "\n\n".join(retrieved)
@@ -335,7 +538,7 @@ def query_documents():
         logger.info("Sending request to Ollama chat")
         
         try:
-            answer = ollama_chat_with_retry([{"role": "user", "content": prompt}])
+            answer = cached_chat_answer(prompt)
             logger.info(f"Received answer from Ollama: {answer[:100]}...")
         except Exception as e:
             logger.error(f"Error getting answer from Ollama: {str(e)}")
@@ -349,7 +552,7 @@ def query_documents():
             "question": question,
             "answer": answer,
             "retrieved_chunks": retrieved,
-            "similarity_scores": D[0].tolist()
+            "similarity_scores": scores
         })
         
     except Exception as e:
@@ -363,19 +566,16 @@ def query_documents():
 @app.route('/status', methods=['GET'])
 def get_status():
     """Get current index status"""
-    index_exists = os.path.exists(INDEX_FILE) and os.path.exists(DOCS_FILE)
-    
-    if index_exists:
-        try:
-            with open(DOCS_FILE, "rb") as f:
-                docs = pickle.load(f)
-            chunks_count = len(docs)
-        except:
-            chunks_count = 0
-    else:
+    # Reuse the in-process index cache: a single stat when it is already loaded
+    try:
+        _, docs = load_index()
+        index_exists = True
+        chunks_count = len(docs) if docs is not None else 0  # None while an upload is in progress
+    except Exception:
+        index_exists = False
         chunks_count = 0
     
-    ollama_status, ollama_msg = test_ollama_connection()
+    ollama_status, ollama_msg = cached_ollama_status()
     
     return jsonify({
         "index_exists": index_exists,
@@ -408,13 +608,14 @@ def list_models():
 def clear_index():
     """Clear the current index"""
     try:
-        files_to_remove = [INDEX_FILE, DOCS_FILE]
+        files_to_remove = [INDEX_FILE, DOCS_FILE, DOCS_OFFSETS_FILE]
         removed_files = []
         
         for file in files_to_remove:
             if os.path.exists(file):
                 os.remove(file)
                 removed_files.append(file)
+        invalidate_index_cache()
         
         return jsonify({
             "success": True,
@@ -438,7 +639,8 @@ def internal_error(e):
 if __name__ == '__main__':
     print("🚀 Starting Flask RAG API Server...")
     print("📋 Available endpoints:")
-    print("  GET  /health  - Health check with Ollama status")
+    print("  GET  /health  - Health check")
+    print("  GET  /health/deep - Health check with live Ollama test")
     print("  GET  /status  - Get index and Ollama status")
     print("  GET  /models  - List available Ollama models")
     print("  POST /upload  - Upload and process file")
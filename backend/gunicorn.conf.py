@@ -0,0 +1,22 @@
+# Gunicorn settings for the backend APIs; picked up automatically when running
+# gunicorn from this directory. Command-line flags override these values.
+import sys
+
+bind = "0.0.0.0:5000"
+workers = 2
+threads = 4
+timeout = 120
+preload_app = True  # Load BioBERT once in the master (on CPU); workers share it copy-on-write
+
+
+def post_worker_init(worker):
+    # Warm up inside each worker rather than in the master: torch's OpenMP
+    # thread pool must not be started before fork. CUDA is the same: a CUDA
+    # context created in the master cannot be used by forked workers ("Cannot
+    # re-initialize CUDA in forked subprocess"), so the master keeps BioBERT on
+    # the CPU and each worker moves it to the GPU here. Only the report API
+    # (simplifier.py) has models to move and warm up.
+    simplifier = sys.modules.get("simplifier")
+    if simplifier is not None:
+        simplifier.biobert_to_gpu()
+        simplifier.warmup()
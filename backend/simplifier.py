@@ -1,18 +1,21 @@
 import os
+import io
+import math
 import faiss
-import pickle
 import numpy as np
 import pytesseract
 from flask import Flask, request, jsonify
 from werkzeug.utils import secure_filename
 import ollama
-import tempfile
-import shutil
 import traceback
 import logging
 import time
 import re
-from collections import Counter
+import hashlib
+import functools
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -30,11 +33,18 @@ except ImportError:
     logger.warning("PyPDF2 not available")
 
 try:
-    from PIL import Image
-    import pytesseract
+    import pypdfium2 as pdfium
+    logger.info("pypdfium2 imported successfully")
+except ImportError:
+    pdfium = None
+    logger.warning("pypdfium2 not available - using PyPDF2 for PDFs")
+
+try:
+    from PIL import Image, ImageOps
     logger.info("PIL and pytesseract imported successfully")
 except ImportError:
     Image = None
+    ImageOps = None
     pytesseract = None
     logger.warning("PIL or pytesseract not available")
 
@@ -45,6 +55,20 @@ except ImportError:
     docx = None
     logger.warning("python-docx not available")
 
+try:
+    import fitz  # PyMuPDF, renders scanned PDF pages for OCR
+    logger.info("PyMuPDF imported successfully")
+except ImportError:
+    fitz = None
+    logger.warning("PyMuPDF not available - scanned PDFs will not be OCR'd")
+
+try:
+    import ahocorasick  # pyahocorasick, single-pass multi-keyword scan for report type detection
+    logger.info("pyahocorasick imported successfully")
+except ImportError:
+    ahocorasick = None
+    logger.info("pyahocorasick not available - using regex for report type detection")
+
 # BioBERT and transformers
 try:
     from transformers import AutoTokenizer, AutoModel
@@ -60,18 +84,37 @@ app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
 # ------------------ Config ------------------
-UPLOAD_FOLDER = 'uploads'
 INDEX_FILE = "biobert_faiss_index"
-KEYWORDS_FILE = "medical_keywords.pkl"
+KEYWORDS_FILE = "medical_keywords.npz"
 CHUNK_SIZE = 500
 CHUNK_OVERLAP = 50
+OCR_DPI = 200  # Render resolution for scanned PDF pages
+OCR_CONFIG = "--oem 1 --psm 6"  # LSTM engine only, single uniform block of text
+OCR_THRESHOLD = 180  # Gray level above which a pixel becomes white when binarizing for OCR
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'png', 'jpg', 'jpeg', 'docx'}
 
 # Model settings
 BIOBERT_MODEL = "dmis-lab/biobert-v1.1"  # Pre-trained BioBERT model
+BIOBERT_INT8 = True  # Dynamically quantize BioBERT's Linear layers to INT8 (CPU only; GPU runs FP16)
+BIOBERT_COMPILE = False  # torch.compile the GPU model (first batches pay compile time; warmup absorbs it)
 OLLAMA_CHAT_MODEL = "llama3.2"  # For explanations
+EMBED_BATCH_SIZE = 32  # Keywords per BioBERT forward pass
+REGEX_KEYWORDS_ENOUGH = 8  # Skip clinical-sentence mining when regex alone finds this many unique keywords
+EMBED_MAX_LENGTH = 128  # Token cap per keyword context (contexts are ~100 chars around the match)
+EXPLAIN_WORKERS = 8  # Concurrent Ollama explanation requests per upload
 MAX_RETRIES = 3
 RETRY_DELAY = 2
+TEXT_CACHE_SIZE = 32  # Extracted texts kept in memory, keyed by file content hash
+
+# FAISS index settings
+IVF_MIN_VECTORS = 1000  # Below this, a brute-force (non-IVF) index is used
+IVFPQ_MIN_VECTORS = 10000  # Above this, vectors are also OPQ + product-quantized (PQ codebooks need ~40x256 points)
+IVF_NPROBE = 16  # Inverted lists scanned per query
+PQ_M = 64  # PQ sub-quantizers (must divide the embedding dimension; 768 / 64 = 12)
+SQ_TYPE = faiss.ScalarQuantizer.QT_8bit  # Storage format for non-PQ indexes (QT_fp16 for higher fidelity)
+# Memory-map the index on POSIX only: Windows refuses to replace or delete a mapped file on upload / clear
+INDEX_IO_FLAGS = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if os.name != "nt" else 0
+QUERY_TOP_K = 3  # Nearest keywords passed to the model as context for /query
 
 # Medical keyword patterns (basic medical terms)
 MEDICAL_PATTERNS = {
@@ -91,16 +134,60 @@ MEDICAL_PATTERNS = {
     ]
 }
 
-# Create upload directory
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Terms that mark a sentence as medically relevant
+MEDICAL_TERMS = ('test', 'result', 'level', 'count', 'blood', 'urine', 'scan', 'ray', 'normal', 'abnormal', 'high', 'low')
+
+# Compiled once at import so the request path never goes through re's pattern cache.
+# All medical patterns are fused into one alternation so the text is scanned a single time;
+# each branch is wrapped in a named group (labN / radN) that carries its own groups right after it.
+MEDICAL_RE = re.compile(
+    '|'.join(
+        [f'(?P<lab{i}>{p})' for i, p in enumerate(MEDICAL_PATTERNS['lab_values'])] +
+        [f'(?P<rad{i}>{p})' for i, p in enumerate(MEDICAL_PATTERNS['radiology'])]
+    ),
+    re.IGNORECASE
+)
+SENTENCE_SPLIT_RE = re.compile(r'[.!?]+')
+# Substring match like the original `term in sentence_lower` checks, so "tests" / "x-ray" still count
+MEDICAL_TERM_RE = re.compile('|'.join(map(re.escape, MEDICAL_TERMS)), re.IGNORECASE)
+
+# Report type indicators (plain substrings, matched against lower-cased text)
+LAB_INDICATORS = ['blood', 'serum', 'plasma', 'urine', 'glucose', 'cholesterol', 'hemoglobin', 'laboratory', 'lab results']
+RAD_INDICATORS = ['x-ray', 'ct', 'scan', 'mri', 'ultrasound', 'radiology', 'image', 'chest', 'abdomen']
+LAB_INDICATORS_RE = re.compile('|'.join(map(re.escape, LAB_INDICATORS)))
+RAD_INDICATORS_RE = re.compile('|'.join(map(re.escape, RAD_INDICATORS)))
+
+# Both indicator lists in one automaton, so the text is scanned once for all of them
+REPORT_AUTOMATON = None
+if ahocorasick:
+    REPORT_AUTOMATON = ahocorasick.Automaton()
+    for label, indicators in (('lab', LAB_INDICATORS), ('radiology', RAD_INDICATORS)):
+        for indicator in indicators:
+            REPORT_AUTOMATON.add_word(indicator, (label, indicator))
+    REPORT_AUTOMATON.make_automaton()
+
+# Extracted text by SHA-256 of the uploaded bytes, so re-uploads skip OCR/parsing
+text_cache = OrderedDict()
+text_cache_lock = threading.Lock()  # Request threads share the cache; extraction itself runs unlocked
 
 # Global variables for BioBERT
 biobert_tokenizer = None
 biobert_model = None
+biobert_device = 'cpu'
+biobert_gpu_pending = False  # Loaded for CUDA but still on the CPU (preloaded before fork)
+biobert_gpu_lock = threading.Lock()
+
+# In-process cache of the keyword index and store, reloaded when either file changes on disk
+index_lock = threading.Lock()
+index_cache = {"mtime": None, "index": None, "keywords": None}
 
-def initialize_biobert():
-    """Initialize BioBERT model and tokenizer"""
-    global biobert_tokenizer, biobert_model
+def initialize_biobert(preload=False):
+    """Initialize BioBERT model and tokenizer.
+    
+    With preload=True (a preforking server's master) CUDA is not touched: the model
+    stays on the CPU and moves to the GPU in each worker, on its first use after fork.
+    """
+    global biobert_tokenizer, biobert_model, biobert_device, biobert_gpu_pending
     
     if not BIOBERT_AVAILABLE:
         logger.warning("BioBERT not available - using fallback keyword extraction")
@@ -108,117 +195,249 @@ def initialize_biobert():
     
     try:
         logger.info("Loading BioBERT model...")
+        # is_available() only queries the driver; it does not initialize CUDA in this process
+        use_cuda = torch.cuda.is_available()
         biobert_tokenizer = AutoTokenizer.from_pretrained(BIOBERT_MODEL)
-        biobert_model = AutoModel.from_pretrained(BIOBERT_MODEL)
+        # low_cpu_mem_usage loads weights straight into the model (mmap'd when the
+        # checkpoint is safetensors) instead of building a random init first
+        biobert_model = AutoModel.from_pretrained(
+            BIOBERT_MODEL,
+            torch_dtype=torch.float16 if use_cuda else torch.float32,
+            low_cpu_mem_usage=True
+        )
         biobert_model.eval()
-        logger.info("✅ BioBERT model loaded successfully")
+        biobert_device = 'cpu'
+        if use_cuda:
+            biobert_gpu_pending = True
+            if not preload:
+                biobert_to_gpu()
+        elif BIOBERT_INT8:
+            biobert_model = torch.quantization.quantize_dynamic(
+                biobert_model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+            logger.info("BioBERT quantized to INT8")
+        logger.info(f"✅ BioBERT model loaded successfully on {biobert_device}")
         return True
     except Exception as e:
         logger.error(f"❌ Failed to load BioBERT: {str(e)}")
         return False
 
+def biobert_to_gpu():
+    """Move the loaded FP16 model onto the GPU (and compile it); must run after any fork"""
+    global biobert_model, biobert_device, biobert_gpu_pending
+    
+    with biobert_gpu_lock:
+        if not biobert_gpu_pending:
+            return
+        # .to() moves the module in place: other threads wait on the lock until the move
+        # is complete, and only then see the new device / cleared flag
+        try:
+            model = biobert_model.to('cuda')
+        except Exception as e:
+            # Don't leave a half-moved model behind: put it back and keep serving on the CPU
+            logger.error(f"Failed to move BioBERT to cuda, staying on cpu: {str(e)}")
+            biobert_model = biobert_model.to('cpu').float()
+            biobert_gpu_pending = False
+            return
+        if BIOBERT_COMPILE and hasattr(torch, 'compile'):
+            model = torch.compile(model, dynamic=True)
+            logger.info("BioBERT compiled with torch.compile")
+        biobert_model = model
+        biobert_device = 'cuda'
+        biobert_gpu_pending = False
+        logger.info("BioBERT moved to cuda")
+
+def warmup():
+    """Run a tiny embedding and OCR so the first request doesn't pay lazy-init costs.
+    
+    Disabled with WARMUP=0.
+    """
+    if os.environ.get('WARMUP', '1') != '1':
+        return
+    
+    start = time.time()
+    try:
+        if biobert_model is not None:
+            create_biobert_embeddings([{'keyword': 'warmup'}])
+        if Image and pytesseract:
+            ocr_image(Image.new('RGB', (32, 32), 'white'))
+        logger.info(f"Warmup finished in {time.time() - start:.2f}s")
+    except Exception as e:
+        logger.warning(f"Warmup failed: {str(e)}")
+
 # ------------------ Helpers ------------------
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def extract_text_from_file(file_path):
-    """Extract text from various file formats"""
-    ext = os.path.splitext(file_path)[1].lower()
-    logger.info(f"Extracting text from {ext} file: {file_path}")
+def ocr_image(img):
+    """OCR an image after grayscale + contrast stretch + binarization"""
+    img = ImageOps.autocontrast(img.convert("L"))
+    img = img.point(lambda p: 255 if p > OCR_THRESHOLD else 0)
+    return pytesseract.image_to_string(img, config=OCR_CONFIG)
+
+def ocr_pdf_pages(data):
+    """OCR a scanned PDF by rendering its pages straight to in-memory images"""
+    # Render sequentially (MuPDF documents are not thread-safe), then OCR in parallel:
+    # Tesseract runs out of process, so pages overlap without contending for the GIL.
+    # Pages are rendered one batch of max_workers at a time, so only that many
+    # full-resolution images are held in memory at once.
+    max_workers = os.cpu_count() or 1
+    texts = []
+    pdf = fitz.open(stream=data, filetype="pdf")
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            images = []
+            for page in pdf:
+                pix = page.get_pixmap(dpi=OCR_DPI)
+                images.append(Image.frombytes("RGB", [pix.width, pix.height], pix.samples))
+                if len(images) == max_workers:
+                    texts.extend(executor.map(ocr_image, images))
+                    images = []
+            texts.extend(executor.map(ocr_image, images))
+    finally:
+        pdf.close()
+    return "\n".join(texts)
+
+def extract_text_from_file(data, ext):
+    """Extract text from an uploaded file's bytes, dispatching on its extension"""
+    logger.info(f"Extracting text from {ext} file ({len(data)} bytes)")
     
     if ext == ".pdf":
-        if not PdfReader:
-            raise ImportError("PyPDF2 is required for PDF files")
-        reader = PdfReader(file_path)
-        text = ""
-        for page in reader.pages:
-            t = page.extract_text()
-            if t:
-                text += t + "\n"
+        # Collect pages and join once; repeated str += is quadratic on long documents
+        pages = []
+        if pdfium:
+            # PDFium (C++) is much faster than PyPDF2's pure-Python parser
+            pdf = pdfium.PdfDocument(data)
+            try:
+                for page in pdf:
+                    textpage = page.get_textpage()
+                    t = textpage.get_text_range()
+                    textpage.close()
+                    page.close()
+                    if t:
+                        pages.append(t)
+            finally:
+                pdf.close()
+        elif PdfReader:
+            reader = PdfReader(io.BytesIO(data))
+            for page in reader.pages:
+                t = page.extract_text()
+                if t:
+                    pages.append(t)
+        else:
+            raise ImportError("pypdfium2 or PyPDF2 is required for PDF files")
+        text = "\n".join(pages)
+        if not text.strip() and fitz and Image and pytesseract:
+            logger.info("No embedded text in PDF, falling back to OCR")
+            text = ocr_pdf_pages(data)
         return text
     
     elif ext in [".jpg", ".jpeg", ".png"]:
         if not Image or not pytesseract:
             raise ImportError("Pillow and pytesseract are required for image files")
-        img = Image.open(file_path)
-        text = pytesseract.image_to_string(img)
+        img = Image.open(io.BytesIO(data))
+        text = ocr_image(img)
         return text
     
     elif ext == ".txt":
-        with open(file_path, "r", encoding="utf-8") as f:
-            return f.read()
+        return data.decode("utf-8")
     
     elif ext == ".docx":
         if not docx:
             raise ImportError("python-docx is required for DOCX files")
-        doc = docx.Document(file_path)
+        doc = docx.Document(io.BytesIO(data))
         return "\n".join([p.text for p in doc.paragraphs])
     
     else:
         raise ValueError(f"Unsupported file type: {ext}")
 
+def extract_text_cached(data, ext):
+    """Extract text, reusing the result for files with identical content"""
+    key = (hashlib.sha256(data).hexdigest(), ext)
+    with text_cache_lock:
+        text = text_cache.get(key)
+        if text is not None:
+            text_cache.move_to_end(key)
+    if text is not None:
+        logger.info(f"Text cache hit for {key[0][:12]}")
+        return text
+    
+    text = extract_text_from_file(data, ext)
+    with text_cache_lock:
+        text_cache[key] = text
+        text_cache.move_to_end(key)
+        if len(text_cache) > TEXT_CACHE_SIZE:
+            text_cache.popitem(last=False)
+    return text
+
+def get_context(text, span, pad=50):
+    """Text around a keyword match, pad characters on either side"""
+    start, end = span
+    return text[max(0, start - pad):end + pad]
+
 def extract_medical_keywords_regex(text):
     """Extract medical keywords using regex patterns (fallback method)"""
-    keywords = []
-    
-    # Lab values
-    for i, pattern in enumerate(MEDICAL_PATTERNS['lab_values']):
-        matches = re.finditer(pattern, text, re.IGNORECASE)
-        for match in matches:
-            keyword = match.group(0).strip()
-            value = match.group(1) if len(match.groups()) >= 1 else None
-            unit = match.group(2) if len(match.groups()) >= 2 else None
-            
-            keywords.append({
+    lab_keywords = []
+    radiology_keywords = []
+    
+    # Single pass; lastgroup tells which pattern fired.
+    # Only the match span is kept: context strings are sliced later, for the keywords that survive dedupe
+    for match in MEDICAL_RE.finditer(text):
+        keyword = match.group(0).strip()
+        
+        if match.lastgroup.startswith('lab'):
+            branch = MEDICAL_RE.groupindex[match.lastgroup]
+            lab_keywords.append({
                 'keyword': keyword,
                 'type': 'lab_value',
-                'value': value,
-                'unit': unit,
-                'context': text[max(0, match.start()-50):match.end()+50]
+                'value': match.group(branch + 1),
+                'unit': match.group(branch + 2),
+                'span': match.span()
             })
-    
-    # Radiology findings
-    for pattern in MEDICAL_PATTERNS['radiology']:
-        matches = re.finditer(pattern, text, re.IGNORECASE)
-        for match in matches:
-            keyword = match.group(0).strip()
-            keywords.append({
+        else:
+            radiology_keywords.append({
                 'keyword': keyword,
                 'type': 'radiology',
-                'context': text[max(0, match.start()-50):match.end()+50]
+                'span': match.span()
             })
     
-    return keywords
+    # Lab values first, as before: only the first keywords get explanations
+    return lab_keywords + radiology_keywords
 
 def extract_medical_keywords_biobert(text):
     """Extract medical keywords using BioBERT embeddings"""
+    # Regex keywords are the candidates on every path, so extract them exactly once
+    regex_keywords = extract_medical_keywords_regex(text)
+    
     if not biobert_model or not biobert_tokenizer:
         logger.warning("BioBERT not available, using regex fallback")
-        return extract_medical_keywords_regex(text)
+        return regex_keywords
+    
+    # Count what survives dedupe: a report repeating "normal" is not a rich set of findings
+    unique_count = len(dedupe_keywords(regex_keywords))
+    if unique_count >= REGEX_KEYWORDS_ENOUGH:
+        logger.info(f"Regex found {unique_count} unique keywords, skipping sentence mining")
+        return regex_keywords
     
     try:
-        # First get regex keywords as candidates
-        regex_keywords = extract_medical_keywords_regex(text)
-        
         # Split text into sentences for better BioBERT processing
-        sentences = re.split(r'[.!?]+', text)
-        sentences = [s.strip() for s in sentences if len(s.strip()) > 10]
+        sentences = (s.strip() for s in SENTENCE_SPLIT_RE.split(text))
         
-        # Use BioBERT to get embeddings for medical relevance scoring
+        # Simple medical relevance check, one regex search per sentence
         medical_sentences = []
         for sentence in sentences:
-            # Simple medical relevance check
-            medical_terms = ['test', 'result', 'level', 'count', 'blood', 'urine', 'scan', 'ray', 'normal', 'abnormal', 'high', 'low']
-            if any(term in sentence.lower() for term in medical_terms):
+            if len(sentence) > 10 and MEDICAL_TERM_RE.search(sentence):
                 medical_sentences.append(sentence)
+                if len(medical_sentences) == 5:  # Limit to top 5
+                    break
         
         # Combine regex results with BioBERT-enhanced results
         enhanced_keywords = regex_keywords.copy()
         
         # Add high-confidence medical sentences as additional keywords
-        for sentence in medical_sentences[:5]:  # Limit to top 5
+        for sentence in medical_sentences:
             enhanced_keywords.append({
-                'keyword': sentence.strip(),
+                'keyword': sentence,
                 'type': 'clinical_note',
                 'context': sentence
             })
@@ -227,7 +446,7 @@ def extract_medical_keywords_biobert(text):
         
     except Exception as e:
         logger.error(f"BioBERT processing failed: {str(e)}")
-        return extract_medical_keywords_regex(text)
+        return regex_keywords
 
 def create_biobert_embeddings(keywords):
     """Create BioBERT embeddings for keywords"""
@@ -236,25 +455,135 @@ def create_biobert_embeddings(keywords):
         return None
     
     try:
-        embeddings = []
-        for keyword_data in keywords:
-            text = keyword_data.get('context', keyword_data['keyword'])
+        biobert_to_gpu()  # No-op once the model is on its device
+        texts = [keyword_data.get('context', keyword_data['keyword']) for keyword_data in keywords]
+        # One float32 output buffer; each batch's CLS rows are written straight into their slice
+        embeddings = np.empty((len(texts), biobert_model.config.hidden_size), dtype=np.float32)
+        for start in range(0, len(texts), EMBED_BATCH_SIZE):
+            # Tokenize and encode one batch per forward pass, padded only to its own longest text
+            inputs = biobert_tokenizer(texts[start:start + EMBED_BATCH_SIZE], return_tensors="pt",
+                                       truncation=True, padding='longest', max_length=EMBED_MAX_LENGTH)
+            inputs = {k: v.to(biobert_device, non_blocking=True) for k, v in inputs.items()}
             
-            # Tokenize and encode
-            inputs = biobert_tokenizer(text, return_tensors="pt", truncation=True, padding=True, max_length=512)
-            
-            with torch.no_grad():
+            with torch.inference_mode(), torch.autocast(device_type=biobert_device, dtype=torch.float16,
+                                                        enabled=biobert_device == 'cuda'):
                 outputs = biobert_model(**inputs)
                 # Use CLS token embedding
-                embedding = outputs.last_hidden_state[:, 0, :].numpy()
-                embeddings.append(embedding.flatten())
+                embeddings[start:start + EMBED_BATCH_SIZE] = outputs.last_hidden_state[:, 0, :].float().cpu().numpy()
         
-        return np.array(embeddings).astype('float32')
+        return embeddings
         
     except Exception as e:
         logger.error(f"Failed to create BioBERT embeddings: {str(e)}")
         return None
 
+def build_faiss_index(embeddings):
+    """Pick a FAISS index for the number of keyword vectors, then train and fill it.
+    
+    Vectors are L2-normalized in place and searched by inner product (cosine).
+    """
+    faiss.normalize_L2(embeddings)
+    n, dimension = embeddings.shape
+    if n < IVF_MIN_VECTORS:
+        # 1 byte per dimension instead of 4; the SQ needs a (cheap) training pass for value ranges
+        index = faiss.IndexScalarQuantizer(dimension, SQ_TYPE, faiss.METRIC_INNER_PRODUCT)
+    else:
+        nlist = min(256, max(4, int(math.sqrt(n))))
+        quantizer = faiss.IndexFlatIP(dimension)
+        if n >= IVFPQ_MIN_VECTORS and dimension % PQ_M == 0:
+            # OPQ rotation + IVF-PQ: 1-byte codes per sub-vector
+            ivf = faiss.IndexIVFPQ(quantizer, dimension, nlist, PQ_M, 8, faiss.METRIC_INNER_PRODUCT)
+            index = faiss.IndexPreTransform(faiss.OPQMatrix(dimension, PQ_M), ivf)
+        else:
+            ivf = index = faiss.IndexIVFScalarQuantizer(quantizer, dimension, nlist, SQ_TYPE, faiss.METRIC_INNER_PRODUCT)
+        ivf.nprobe = IVF_NPROBE  # Only nprobe inverted lists are scanned per query
+    index.train(embeddings)
+    index.add(embeddings)
+    return index
+
+class KeywordStore:
+    """Stored keywords as one numpy string column per field, rebuilt into dicts only when selected.
+    
+    The document text is stored once with an (N, 2) int32 span column; contexts are sliced on demand.
+    """
+    FIELDS = ('keyword', 'type', 'value', 'unit')
+    
+    def __init__(self, path=KEYWORDS_FILE):
+        with np.load(path) as npz:
+            self.columns = {field: npz[field] for field in self.FIELDS}
+            self.spans = npz['spans']
+            self.text = npz['text'].tobytes().decode("utf-8")
+    
+    def __len__(self):
+        return len(self.columns['keyword'])
+    
+    def __getitem__(self, i):
+        keyword_data = {'keyword': str(self.columns['keyword'][i]), 'type': str(self.columns['type'][i])}
+        for field in ('value', 'unit'):
+            if self.columns[field][i]:
+                keyword_data[field] = str(self.columns[field][i])
+        if self.spans[i][0] >= 0:
+            keyword_data['context'] = get_context(self.text, self.spans[i])
+        else:
+            keyword_data['context'] = keyword_data['keyword']  # Clinical notes are their own context
+        return keyword_data
+    
+    def match_words(self, words):
+        """Ids of keywords containing any of the words, scanned column-wise"""
+        lowered = np.char.lower(self.columns['keyword'])
+        mask = np.zeros(len(lowered), dtype=bool)
+        for word in words:
+            mask |= np.char.find(lowered, word) >= 0
+        return np.flatnonzero(mask)
+    
+    @staticmethod
+    def save(keywords, text, path=KEYWORDS_FILE):
+        """Write keywords column-wise, replacing the previous store atomically"""
+        columns = {
+            field: np.array([str(keyword_data.get(field) or '') for keyword_data in keywords], dtype=str)
+            for field in KeywordStore.FIELDS
+        }
+        columns['spans'] = np.array([keyword_data.get('span', (-1, -1)) for keyword_data in keywords],
+                                    dtype=np.int32).reshape(-1, 2)
+        columns['text'] = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, **columns)
+        os.replace(path + ".tmp", path)
+
+def load_index():
+    """Return (index, keywords), reading them from disk only when either file changed.
+    
+    The index is None when the last upload was processed without BioBERT.
+    """
+    index_mtime = os.path.getmtime(INDEX_FILE) if os.path.exists(INDEX_FILE) else None
+    mtime = (os.path.getmtime(KEYWORDS_FILE), index_mtime)
+    with index_lock:
+        if index_cache["keywords"] is None or index_cache["mtime"] != mtime:
+            logger.info("Loading FAISS index and keywords from disk")
+            index = None
+            if index_mtime is not None:
+                # Memory-mapped where possible: pages are faulted in on demand and shared between workers
+                index = faiss.read_index(INDEX_FILE, INDEX_IO_FLAGS)
+            index_cache.update(mtime=mtime, index=index, keywords=KeywordStore())
+        return index_cache["index"], index_cache["keywords"]
+
+def invalidate_index_cache():
+    """Drop the in-process index so the next query reloads it"""
+    with index_lock:
+        index_cache.update(mtime=None, index=None, keywords=None)
+
+def search_keywords(question, index, num_keywords):
+    """Return ids of the stored keywords nearest to the question, or None if no index/embedding is available"""
+    if index is None or index.ntotal != num_keywords:
+        return None
+    
+    q_emb = create_biobert_embeddings([{'keyword': question}])
+    if q_emb is None:
+        return None
+    faiss.normalize_L2(q_emb)
+    _, ids = index.search(q_emb, min(QUERY_TOP_K, index.ntotal))
+    return [int(i) for i in ids[0] if i >= 0]
+
 def ollama_chat_with_retry(messages, max_retries=MAX_RETRIES):
     """Get chat response with retry logic"""
     for attempt in range(max_retries):
@@ -270,6 +599,11 @@ def ollama_chat_with_retry(messages, max_retries=MAX_RETRIES):
             else:
                 raise e
 
+@functools.lru_cache(maxsize=1024)
+def cached_chat_answer(prompt):
+    """Single-prompt chat completion, memoized on the prompt text"""
+    return ollama_chat_with_retry([{"role": "user", "content": prompt}])
+
 def generate_keyword_explanation(keyword_data):
     """Generate explanation for a keyword using Ollama"""
     try:
@@ -311,8 +645,7 @@ Context: {context}
 
 Please provide a brief, patient-friendly explanation in under 100 words."""
         
-        messages = [{"role": "user", "content": prompt}]
-        explanation = ollama_chat_with_retry(messages)
+        explanation = cached_chat_answer(prompt)
         
         return explanation.strip()
         
@@ -320,15 +653,27 @@ Please provide a brief, patient-friendly explanation in under 100 words."""
         logger.error(f"Failed to generate explanation for {keyword}: {str(e)}")
         return f"Medical term: {keyword_data['keyword']}"
 
+def dedupe_keywords(keywords):
+    """Keep the first occurrence of each (type, keyword) pair"""
+    unique = {}
+    for keyword_data in keywords:
+        key = (keyword_data.get('type'), keyword_data['keyword'].lower())
+        unique.setdefault(key, keyword_data)
+    return list(unique.values())
+
 def determine_report_type(text):
     """Determine if report is lab or radiology based on content"""
     text_lower = text.lower()
     
-    lab_indicators = ['blood', 'serum', 'plasma', 'urine', 'glucose', 'cholesterol', 'hemoglobin', 'laboratory', 'lab results']
-    rad_indicators = ['x-ray', 'ct', 'scan', 'mri', 'ultrasound', 'radiology', 'image', 'chest', 'abdomen']
-    
-    lab_score = sum(1 for indicator in lab_indicators if indicator in text_lower)
-    rad_score = sum(1 for indicator in rad_indicators if indicator in text_lower)
+    # Score = number of distinct indicators present
+    if REPORT_AUTOMATON:
+        found = {value for _, value in REPORT_AUTOMATON.iter(text_lower)}
+        counts = Counter(label for label, _ in found)
+        lab_score, rad_score = counts['lab'], counts['radiology']
+    else:
+        # Each category in one regex pass
+        lab_score = len(set(LAB_INDICATORS_RE.findall(text_lower)))
+        rad_score = len(set(RAD_INDICATORS_RE.findall(text_lower)))
     
     if lab_score > rad_score:
         return 'lab'
@@ -378,22 +723,20 @@ def upload_file():
                 "error": f"File type not allowed. Supported: {', '.join(ALLOWED_EXTENSIONS)}"
             }), 400
         
-        # Save uploaded file
+        # Read the upload into memory; every extractor works from bytes, nothing touches disk
         filename = secure_filename(file.filename)
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(file_path)
-        logger.info(f"File saved: {filename}")
+        ext = "." + file.filename.rsplit('.', 1)[1].lower()
+        data = file.read()
+        logger.info(f"Received {filename} ({len(data)} bytes)")
         
         # Extract text
         try:
-            text = extract_text_from_file(file_path)
+            text = extract_text_cached(data, ext)
             logger.info(f"Extracted text length: {len(text)} characters")
         except Exception as e:
-            os.remove(file_path)
             return jsonify({"success": False, "error": f"Text extraction failed: {str(e)}"}), 400
         
         if not text.strip():
-            os.remove(file_path)
             return jsonify({"success": False, "error": "No text found in file"}), 400
         
         # Determine report type
@@ -401,11 +744,15 @@ def upload_file():
         logger.info(f"Report type detected: {report_type}")
         
         # Extract medical keywords using BioBERT + regex
-        keywords = extract_medical_keywords_biobert(text)
-        logger.info(f"Extracted {len(keywords)} medical keywords")
+        keywords = dedupe_keywords(extract_medical_keywords_biobert(text))
+        logger.info(f"Extracted {len(keywords)} unique medical keywords")
+        
+        # Contexts are only built for the keywords that survived dedupe
+        for keyword_data in keywords:
+            if 'span' in keyword_data:
+                keyword_data['context'] = get_context(text, keyword_data['span'])
         
         if not keywords:
-            os.remove(file_path)
             return jsonify({
                 "success": True,
                 "report_type": report_type,
@@ -416,46 +763,42 @@ def upload_file():
         
         # Create FAISS index with BioBERT embeddings
         embeddings = create_biobert_embeddings(keywords)
-        if embeddings is not None:
-            dimension = embeddings.shape[1]
-            index = faiss.IndexFlatL2(dimension)
-            index.add(embeddings)
-            
-            # Save FAISS index
-            faiss.write_index(index, INDEX_FILE)
+        index = build_faiss_index(embeddings) if embeddings is not None else None
+        if index is None and os.path.exists(INDEX_FILE):
+            os.remove(INDEX_FILE)  # Stale: it belongs to the previous document's keywords
+        
+        # Save keywords, then the index, before the slow explanation phase: /query pairs
+        # whatever is on disk, so the new index must never go live next to old keywords
+        KeywordStore.save(keywords, text)
+        if index is not None:
+            # Replace, never rewrite in place: queries may have the index memory-mapped
+            faiss.write_index(index, INDEX_FILE + ".tmp")
+            os.replace(INDEX_FILE + ".tmp", INDEX_FILE)
             logger.info(f"Created FAISS index with {index.ntotal} vectors")
+        invalidate_index_cache()
+        
+        # Generate explanations for each keyword (Ollama calls overlap; map keeps keyword order)
+        top_keywords = keywords[:10]  # Limit to first 10 keywords
+        with ThreadPoolExecutor(max_workers=EXPLAIN_WORKERS) as executor:
+            explanation_texts = list(executor.map(generate_keyword_explanation, top_keywords))
         
-        # Generate explanations for each keyword
         explanations = []
-        for i, keyword_data in enumerate(keywords[:10]):  # Limit to first 10 keywords
-            try:
-                explanation_text = generate_keyword_explanation(keyword_data)
-                
-                explanation = {
-                    "keyword_number": i + 1,
-                    "keyword": keyword_data['keyword'],
-                    "explanation": explanation_text,
-                    "type": keyword_data.get('type', 'medical')
-                }
-                
-                # Add value and unit if available
-                if keyword_data.get('value'):
-                    explanation["value"] = keyword_data['value']
-                if keyword_data.get('unit'):
-                    explanation["unit"] = keyword_data['unit']
-                
-                explanations.append(explanation)
-                
-            except Exception as e:
-                logger.error(f"Failed to explain keyword {i}: {str(e)}")
-                continue
-        
-        # Save keywords for potential querying later
-        with open(KEYWORDS_FILE, "wb") as f:
-            pickle.dump(keywords, f)
-        
-        # Clean up uploaded file
-        os.remove(file_path)
+        for i, (keyword_data, explanation_text) in enumerate(zip(top_keywords, explanation_texts)):
+            # generate_keyword_explanation never raises; failures come back as a plain fallback text
+            explanation = {
+                "keyword_number": i + 1,
+                "keyword": keyword_data['keyword'],
+                "explanation": explanation_text,
+                "type": keyword_data.get('type', 'medical')
+            }
+            
+            # Add value and unit if available
+            if keyword_data.get('value'):
+                explanation["value"] = keyword_data['value']
+            if keyword_data.get('unit'):
+                explanation["unit"] = keyword_data['unit']
+            
+            explanations.append(explanation)
         
         return jsonify({
             "success": True,
@@ -490,23 +833,22 @@ def query_keywords():
                 "error": "No medical document processed. Please upload a file first."
             }), 400
         
-        # Load keywords
-        with open(KEYWORDS_FILE, "rb") as f:
-            keywords = pickle.load(f)
+        # Load keywords and index (cached in-process)
+        index, keywords = load_index()
         
-        # Simple keyword matching for now (can be enhanced with FAISS similarity)
-        relevant_keywords = []
-        question_lower = question.lower()
+        # Nearest keywords by BioBERT similarity
+        ids = search_keywords(question, index, len(keywords))
         
-        for keyword_data in keywords:
-            if any(word in keyword_data['keyword'].lower() for word in question_lower.split()):
-                relevant_keywords.append(keyword_data)
+        if ids is None:
+            # No index/BioBERT: fall back to simple word matching
+            ids = keywords.match_words(question.lower().split())
         
-        if not relevant_keywords:
-            relevant_keywords = keywords[:3]  # Return first 3 if no matches
+        if not len(ids):
+            ids = range(min(3, len(keywords)))  # Return first 3 if no matches
         
         # Generate answer based on relevant keywords
-        context = "\n".join([f"- {kw['keyword']}: {kw.get('context', '')}" for kw in relevant_keywords[:3]])
+        relevant_keywords = [keywords[i] for i in ids[:3]]
+        context = "\n".join([f"- {kw['keyword']}: {kw.get('context', '')}" for kw in relevant_keywords])
         
         prompt = f"""Based on the following medical findings from a report, please answer the question:
 
@@ -518,7 +860,7 @@ Question: {question}
 Please provide a helpful answer based on the medical findings above."""
 
         try:
-            answer = ollama_chat_with_retry([{"role": "user", "content": prompt}])
+            answer = cached_chat_answer(prompt)
         except Exception as e:
             answer = f"Unable to generate detailed answer due to: {str(e)}"
         
@@ -526,7 +868,7 @@ Please provide a helpful answer based on the medical findings above."""
             "success": True,
             "question": question,
             "answer": answer,
-            "relevant_findings": len(relevant_keywords)
+            "relevant_findings": len(ids)
         })
         
     except Exception as e:
@@ -561,6 +903,7 @@ def clear_data():
             if os.path.exists(file):
                 os.remove(file)
                 removed_files.append(file)
+        invalidate_index_cache()
         
         return jsonify({
             "success": True,
@@ -584,5 +927,6 @@ if __name__ == '__main__':
     biobert_initialized = initialize_biobert()
     if not biobert_initialized:
         print("⚠️  BioBERT not available - using regex fallback for keyword extraction")
+    warmup()
     
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,13 @@
+"""Production entry point for the medical report API (simplifier.py).
+
+    gunicorn wsgi:app
+
+gunicorn.conf.py enables preload_app, so this module is imported once in the
+gunicorn master: BioBERT is loaded a single time and shared copy-on-write by
+the forked workers. It is loaded with preload=True, so the master never
+initializes CUDA; on a GPU host each worker moves the model to the GPU itself.
+"""
+from simplifier import app, initialize_biobert, logger
+
+if not initialize_biobert(preload=True):
+    logger.warning("⚠️  BioBERT not available - using regex fallback for keyword extraction")